@@ -1,21 +1,104 @@
-from flask import Flask, request, jsonify
+# Patch the standard library first so web3/requests socket I/O yields to other greenlets
+from gevent import monkey
+monkey.patch_all()
+
+from flask import Flask, request, url_for
 from flask_cors import CORS
 import os
+import time
+import gevent
+import gevent.event
+import gevent.lock
 from web3 import Web3
-import json
+from eth_account import Account
+from web3.exceptions import TimeExhausted, TransactionNotFound
+from web3.datastructures import AttributeDict
+from web3._utils.method_formatters import receipt_formatter
+from hexbytes import HexBytes
+import websocket
+import orjson
+import functools
+import heapq
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 # --- Flask App Setup ---
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes
 
+
+def json_response(payload, status=200):
+    """Builds a JSON response serialized with orjson."""
+    return app.response_class(orjson.dumps(payload), status=status, mimetype='application/json')
+
+
 # --- Configuration - Read from Environment Variables ---
 RPC_URL = os.environ.get('RPC_URL')
+# Optional WebSocket endpoint used to wait for receipts on new block heads instead of polling
+WS_RPC_URL = os.environ.get('WS_RPC_URL')
 PRIVATE_KEY = os.environ.get('PRIVATE_KEY', '').strip() # Use .get for safety and strip whitespace
 # Read contract artifact path from environment variables
 CONTRACT_ARTIFACT_PATH = os.environ.get('CONTRACT_ARTIFACT_PATH')
-# Read fee recipient address from environment variables
-FEE_RECIPIENT_ADDRESS = os.environ.get('FEE_RECIPIENT_ADDRESS')
+# Read fee recipient address from environment variables, checksummed once here
+# so it isn't re-validated on every deployment
+FEE_RECIPIENT_ADDRESS = os.environ.get('FEE_RECIPIENT_ADDRESS', '').strip()
+if not FEE_RECIPIENT_ADDRESS:
+    print("Error: FEE_RECIPIENT_ADDRESS environment variable not set.")
+    FEE_RECIPIENT_ADDRESS = None
+elif not Web3.is_address(FEE_RECIPIENT_ADDRESS):
+    print(f"Error: FEE_RECIPIENT_ADDRESS is not a valid address: {FEE_RECIPIENT_ADDRESS}")
+    FEE_RECIPIENT_ADDRESS = None
+else:
+    FEE_RECIPIENT_ADDRESS = Web3.to_checksum_address(FEE_RECIPIENT_ADDRESS)
+# Optional fixed constructor gas cost; when set, gas estimation is skipped entirely
+GAS_LIMIT_OVERRIDE = 0
+try:
+    GAS_LIMIT_OVERRIDE = int(os.environ.get('DEPLOY_GAS_LIMIT', '').strip() or '0')
+    if GAS_LIMIT_OVERRIDE < 0:
+        raise ValueError("negative gas limit")
+except ValueError:
+    GAS_LIMIT_OVERRIDE = 0
+    print(f"Error: DEPLOY_GAS_LIMIT is not a valid integer, estimating gas instead: {os.environ.get('DEPLOY_GAS_LIMIT')}")
+# Optional Multicall3 address (canonically 0xcA11bde05977b3631167028862bE2a173976CA11)
+MULTICALL_ADDRESS = os.environ.get('MULTICALL_ADDRESS')
+
+
+# --- Hardcoded Parameters for Pump.fun model ---
+# LP Migration Market Cap (example: 0.01 ETH equivalent)
+LP_MIGRATION_MARKET_CAP_WEI = Web3.to_wei(0.01, 'ether')
+# Upper bounds for client-supplied token metadata
+MAX_TOKEN_NAME_LENGTH = 64
+MAX_TOKEN_SYMBOL_LENGTH = 16
+
+
+# --- Deployer Account (Derived once at startup) ---
+# Deriving the address from the private key is done here instead of per request;
+# signing then reuses this LocalAccount.
+ACCOUNT = None
+if not PRIVATE_KEY:
+    print("Error: PRIVATE_KEY environment variable not set.")
+else:
+    try:
+        ACCOUNT = Account.from_key(PRIVATE_KEY)
+        print(f"Backend deploying from account: {ACCOUNT.address}")
+    except Exception as e:
+        print(f"Error: PRIVATE_KEY is not a valid private key: {e}")
+
+
+# --- HTTP Session (shared keep-alive connection pool for all RPC traffic) ---
+# Only failed connection attempts are retried. Every JSON-RPC call is a POST,
+# and retrying one that may have reached the node (e.g. eth_sendRawTransaction)
+# is not safe, so read errors and 5xx responses are surfaced instead.
+session = requests.Session()
+_rpc_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.2),
+)
+session.mount('https://', _rpc_adapter)
+session.mount('http://', _rpc_adapter)
 
 
 # --- Web3 Connection (Initialize outside the route) ---
@@ -23,7 +106,7 @@ FEE_RECIPIENT_ADDRESS = os.environ.get('FEE_RECIPIENT_ADDRESS')
 w3 = None
 if RPC_URL:
     try:
-        w3 = Web3(Web3.HTTPProvider(RPC_URL))
+        w3 = Web3(Web3.HTTPProvider(RPC_URL, session=session, request_kwargs={'timeout': 30}))
         # Check connection (optional, but good to know if the backend can connect)
         if not w3.is_connected():
             print(f"Warning: Backend could not connect to RPC URL: {RPC_URL}")
@@ -36,92 +119,640 @@ else:
     print("Error: RPC_URL environment variable not set.")
 
 
-# --- Deployment Function ---
-def deploy_contract_backend(w3_instance, artifact_path, private_key, constructor_args):
-    """Deploys a smart contract using web3.py for the backend."""
-    if not private_key:
-        return {"error": "Private key not configured in environment variables."}
-    if not artifact_path:
-        return {"error": "CONTRACT_ARTIFACT_PATH environment variable not set."}
-    if not w3_instance or not w3_instance.is_connected():
-        return {"error": f"Backend not connected to network. RPC_URL: {RPC_URL}"}
+# --- Contract Artifact (Load once at startup) ---
+# The artifact and the chain id never change while the process is running,
+# so they are read once here instead of on every deployment request.
+_ABI = None
+_BYTECODE = None
+_CONTRACT_FACTORY = None
+_ARTIFACT_ERROR = None # Reason the artifact could not be loaded, reported on each request
+if not CONTRACT_ARTIFACT_PATH:
+    _ARTIFACT_ERROR = "CONTRACT_ARTIFACT_PATH environment variable not set."
+else:
+    try:
+        with open(CONTRACT_ARTIFACT_PATH, 'rb') as f:
+            contract_json = orjson.loads(f.read())
+        _ABI = contract_json['abi']
+        _BYTECODE = contract_json['bytecode']
+    except FileNotFoundError:
+        _ARTIFACT_ERROR = f"Contract artifact file not found at {CONTRACT_ARTIFACT_PATH}. Ensure contract is compiled and path is correct."
+    except orjson.JSONDecodeError:
+        _ARTIFACT_ERROR = f"Could not decode JSON from {CONTRACT_ARTIFACT_PATH}. Ensure it's a valid JSON file."
+    except KeyError as e:
+        _ARTIFACT_ERROR = f"Contract artifact {CONTRACT_ARTIFACT_PATH} is missing the {e} field."
+
+if _ARTIFACT_ERROR:
+    print(f"Error: {_ARTIFACT_ERROR}")
+elif w3:
+    _CONTRACT_FACTORY = w3.eth.contract(abi=_ABI, bytecode=_BYTECODE)
+
+
+_chain_id_value = None
+_chain_id_lock = gevent.lock.Semaphore()
+
+
+def _chain_id():
+    """Returns the chain id of the connected network, fetched once on first use."""
+    global _chain_id_value
+    if _chain_id_value is None:
+        with _chain_id_lock:
+            # Concurrent first calls wait here for a single fetch
+            if _chain_id_value is None:
+                _chain_id_value = w3.eth.chain_id
+    return _chain_id_value
+
+
+# --- Multicall ---
+# Contract reads (e.g. pre-deploy validation) should be aggregated through
+# Multicall3 in a single eth_call rather than issued as one eth_call each.
+MULTICALL_ABI = [{
+    "name": "aggregate",
+    "type": "function",
+    "stateMutability": "payable",
+    "inputs": [{
+        "name": "calls",
+        "type": "tuple[]",
+        "components": [
+            {"name": "target", "type": "address"},
+            {"name": "callData", "type": "bytes"},
+        ],
+    }],
+    "outputs": [
+        {"name": "blockNumber", "type": "uint256"},
+        {"name": "returnData", "type": "bytes[]"},
+    ],
+}]
+
+multicall_contract = None
+if MULTICALL_ADDRESS and w3:
+    if Web3.is_address(MULTICALL_ADDRESS):
+        multicall_contract = w3.eth.contract(address=Web3.to_checksum_address(MULTICALL_ADDRESS), abi=MULTICALL_ABI)
+    else:
+        print(f"Error: MULTICALL_ADDRESS is not a valid address: {MULTICALL_ADDRESS}")
+
+
+def multicall(calls):
+    """Runs several contract reads in one eth_call through Multicall3.
+
+    `calls` is a list of (target address, encoded call data) tuples. Returns
+    (block number, list of raw return data) in the same order as `calls`.
+    """
+    if multicall_contract is None:
+        raise RuntimeError("Multicall is not configured. Set MULTICALL_ADDRESS to enable it.")
+    return multicall_contract.functions.aggregate(calls).call()
+
+
+# --- JSON-RPC Batching ---
+# Set to False once the provider has rejected BATCH_REJECTION_LIMIT batches in
+# a row, so later calls go straight to concurrent single requests instead of
+# paying for a failed batch first. 5xx failures fall back for that call only
+# and don't count as rejections. Rate-limited batches are retried once after
+# a back-off instead of being fanned out into more requests.
+BATCH_REJECTION_LIMIT = 3
+RATE_LIMIT_BACKOFF = 1.0 # Seconds, when the provider sends no usable Retry-After
+RATE_LIMIT_MAX_BACKOFF = 5.0
+_batch_supported = True
+_batch_rejections = 0
+
+
+def _post_rpc(payload):
+    """POSTs a JSON-RPC payload to RPC_URL over the shared session and returns the decoded reply."""
+    response = session.post(
+        RPC_URL,
+        data=orjson.dumps(payload),
+        headers={'Content-Type': 'application/json'},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+def _single_rpc_call(method, params):
+    """Sends one JSON-RPC call and returns a (result, error) tuple."""
+    reply = _post_rpc({"jsonrpc": "2.0", "id": 0, "method": method, "params": params})
+    return reply.get('result'), reply.get('error')
+
+
+def concurrent_rpc_calls(calls):
+    """Sends each JSON-RPC call as its own request, with all of them in flight at once.
+
+    Used when the provider doesn't support batching; the total latency is still
+    roughly one round trip because the requests run in parallel greenlets.
+    """
+    greenlets = [gevent.spawn(_single_rpc_call, method, params) for method, params in calls]
+    gevent.joinall(greenlets)
+    results = []
+    for (method, _), greenlet in zip(calls, greenlets):
+        if greenlet.successful():
+            results.append(greenlet.value)
+        else:
+            results.append((None, f"{method} failed: {greenlet.exception}"))
+    return results
 
 
-    # Re-check artifact file existence here as well before trying to open
-    if not os.path.exists(artifact_path):
-         return {"error": f"Contract artifact file not found at {artifact_path}. Ensure contract is compiled and path is correct."}
+def _is_rate_limited(status_code, error):
+    """Tells whether a failed batch was rejected because the provider is rate limiting."""
+    if status_code is not None:
+        return status_code == 429
+    message = str(error).lower()
+    return any(marker in message for marker in ('rate limit', 'limit exceeded', 'too many requests'))
 
 
+def _rate_limit_backoff(retry_after):
+    """Returns how long to wait before retrying, honouring a numeric Retry-After header."""
     try:
-        w3 = w3_instance
+        return min(max(float(retry_after), 0.0), RATE_LIMIT_MAX_BACKOFF)
+    except (TypeError, ValueError):
+        return RATE_LIMIT_BACKOFF
 
-        # Ensure private key is bytes or hex string
-        account = w3.eth.account.from_key(private_key)
-        print(f"Backend deploying from account: {account.address}")
 
+def batch_rpc_calls(calls):
+    """Sends several JSON-RPC calls to RPC_URL in a single HTTP round trip.
+
+    `calls` is a list of (method, params) tuples. Returns a list of
+    (result, error) tuples in the same order as `calls`.
+    """
+    global _batch_supported, _batch_rejections
+    if not _batch_supported:
+        return concurrent_rpc_calls(calls)
+
+    payload = [
+        {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+        for request_id, (method, params) in enumerate(calls)
+    ]
+    # Providers without batch support answer with an HTTP error status or a
+    # single error object instead of a list of replies
+    for attempt in range(2):
+        status_code = None
+        retry_after = None
         try:
-            with open(artifact_path, 'r') as f:
-                contract_json = json.load(f)
-                abi = contract_json['abi']
-                bytecode = contract_json['bytecode']
-        except FileNotFoundError:
-            # This check is redundant if done before, but kept for safety
-            return {"error": f"Contract artifact file not found at {artifact_path}. Ensure contract is compiled."}
-        except json.JSONDecodeError:
-             return {"error": f"Could not decode JSON from {artifact_path}. Ensure it's a valid JSON file."}
+            replies = _post_rpc(payload)
+            failure = None if isinstance(replies, list) else replies
+        except requests.HTTPError as e:
+            status_code = e.response.status_code
+            retry_after = e.response.headers.get('Retry-After')
+            failure = e
+        except orjson.JSONDecodeError as e:
+            failure = e
+
+        if failure is None or not _is_rate_limited(status_code, failure):
+            break
+        if attempt == 0:
+            delay = _rate_limit_backoff(retry_after)
+            print(f"Warning: RPC provider is rate limiting, retrying batch in {delay}s: {failure}")
+            gevent.sleep(delay)
+    else:
+        raise RuntimeError(f"RPC provider is rate limiting requests: {failure}")
+
+    if failure is not None:
+        if status_code is not None and status_code >= 500:
+            print(f"Warning: RPC batch request failed, using concurrent calls instead: {failure}")
+        elif _batch_supported:
+            # Other greenlets may have hit the limit while this batch was in flight
+            _batch_rejections += 1
+            print(f"Warning: RPC provider rejected batch request ({_batch_rejections}/{BATCH_REJECTION_LIMIT}), using concurrent calls instead: {failure}")
+            if _batch_rejections >= BATCH_REJECTION_LIMIT:
+                _batch_supported = False
+        return concurrent_rpc_calls(calls)
+    _batch_rejections = 0
+
+    # Replies may come back in any order, so match them up by id
+    replies_by_id = {reply.get('id'): reply for reply in replies}
+    results = []
+    for request_id in range(len(calls)):
+        reply = replies_by_id.get(request_id)
+        if reply is None:
+            results.append((None, f"No response for batched call {calls[request_id][0]}"))
+        else:
+            results.append((reply.get('result'), reply.get('error')))
+    return results
+
+
+# --- Nonce Management ---
+# Nonces are handed out from a process-local counter so concurrent deployments
+# never reuse the same nonce and don't each pay an RPC round trip for it.
+# The counter only works with a single worker process (see Procfile).
+# None means the counter has to be synced from the node's pending count.
+_nonce_lock = gevent.lock.Semaphore()
+_next_nonce = None
+# Reserved nonces that were never broadcast; handed out again before new ones
+# so a failed send doesn't leave a gap that stalls later deployments.
+_released_nonces = []
+
+# Send errors meaning the nonce is already taken by a transaction in the mempool
+NONCE_TAKEN_ERRORS = ('already known', 'replacement transaction underpriced')
+
+
+def reserve_nonce(w3_instance, address):
+    """Returns the lowest unused nonce for `address`, syncing from the node on first use."""
+    global _next_nonce
+    with _nonce_lock:
+        if _next_nonce is None:
+            _next_nonce = w3_instance.eth.get_transaction_count(address, 'pending')
+            print(f"Backend nonce counter synced from node: {_next_nonce}")
+        if _released_nonces:
+            return heapq.heappop(_released_nonces)
+        nonce = _next_nonce
+        _next_nonce += 1
+        return nonce
+
+
+def release_nonce(nonce):
+    """Returns a reserved nonce that was never broadcast so the next deployment reuses it."""
+    with _nonce_lock:
+        heapq.heappush(_released_nonces, nonce)
+
+
+def resync_nonce(w3_instance, address):
+    """Moves the counter up to the node's pending nonce after a "nonce too low" rejection.
+
+    The counter never moves backwards: nonces below it may belong to
+    transactions still queued behind a gap, and reusing them would collide.
+    """
+    global _next_nonce
+    with _nonce_lock:
+        pending_nonce = w3_instance.eth.get_transaction_count(address, 'pending')
+        _next_nonce = max(_next_nonce or 0, pending_nonce)
+        _released_nonces[:] = [nonce for nonce in _released_nonces if nonce >= pending_nonce]
+        heapq.heapify(_released_nonces)
+        print(f"Backend nonce counter resynced from node: {_next_nonce}")
+
+
+def handle_send_failure(w3_instance, address, nonce, error, signed_transaction=None):
+    """Updates the nonce counter after building, signing or sending a transaction failed.
+
+    Returns True if the signed transaction reached the node despite the error
+    (e.g. the response timed out), in which case the send actually succeeded.
+    """
+    message = str(error).lower()
+    if 'nonce too low' in message:
+        # Something outside this process used the nonce; catch up with the node
+        try:
+            resync_nonce(w3_instance, address)
+        except Exception as resync_error:
+            print(f"Backend could not resync nonce counter: {resync_error}")
+    elif any(taken in message for taken in NONCE_TAKEN_ERRORS):
+        # A pending transaction already holds this nonce, so it can't be reused
+        print(f"Backend nonce {nonce} is already taken in the mempool, skipping it.")
+    elif signed_transaction is not None and isinstance(error, (requests.RequestException, OSError)):
+        # The transaction may have reached the node before the connection failed
+        try:
+            w3_instance.eth.get_transaction(signed_transaction.hash)
+        except TransactionNotFound:
+            print(f"Backend transaction with nonce {nonce} did not reach the node, releasing the nonce.")
+            release_nonce(nonce)
+        except Exception as lookup_error:
+            print(f"Backend could not check whether nonce {nonce} was used, skipping it: {lookup_error}")
+        else:
+            return True
+    else:
+        release_nonce(nonce)
+    return False
+
+
+# --- Constructor Calldata Cache ---
+@functools.lru_cache(maxsize=1024)
+def encoded_constructor_data(*constructor_args):
+    """Returns the deployment calldata (bytecode + ABI-encoded args), cached per argument set.
+
+    The bytecode never changes, so re-submits with the same arguments skip
+    web3's ABI encoding entirely.
+    """
+    return _CONTRACT_FACTORY.constructor(*constructor_args).data_in_transaction
+
+
+# --- Gas Estimate Cache ---
+# The constructor bytecode is fixed, so its gas cost only shifts by a few hundred
+# gas with the size of the string arguments, which the 100000 buffer absorbs.
+# One estimate is cached per ABI-encoded argument size.
+_cached_gas_estimates = {}
+
+
+def gas_estimate_bucket(constructor_args):
+    """Returns the cache key for constructor args: the 32-byte word count of each string arg."""
+    return tuple((len(arg.encode('utf-8')) + 31) // 32 for arg in constructor_args if isinstance(arg, str))
+
+
+# --- Gas Price Cache ---
+# The gas price only moves on block boundaries, so a value fetched within the
+# last GAS_PRICE_TTL seconds is shared by all concurrent deployments.
+GAS_PRICE_TTL = 2.0
+_gas_price_cache = {'value': None, 'fetched_at': 0.0}
+_gas_price_lock = gevent.lock.Semaphore()
+
+
+def _fresh_gas_price():
+    """Returns the cached gas price if it is still within GAS_PRICE_TTL, else None."""
+    if _gas_price_cache['value'] and time.monotonic() - _gas_price_cache['fetched_at'] < GAS_PRICE_TTL:
+        return _gas_price_cache['value']
+    return None
+
+
+def remember_gas_price(gas_price):
+    """Stores a gas price fetched elsewhere (e.g. in a batch) in the cache."""
+    _gas_price_cache['value'] = gas_price
+    _gas_price_cache['fetched_at'] = time.monotonic()
+
+
+def cached_gas_price(w3_instance):
+    """Returns the current gas price, fetching it at most once per GAS_PRICE_TTL."""
+    gas_price = _fresh_gas_price()
+    if gas_price:
+        return gas_price
+    with _gas_price_lock:
+        # Another greenlet may have refreshed the cache while we waited for the lock
+        gas_price = _fresh_gas_price()
+        if not gas_price:
+            gas_price = w3_instance.eth.gas_price
+            remember_gas_price(gas_price)
+        return gas_price
+
+
+# --- Deployment Status Tracking ---
+# In-memory deployment results keyed by lowercase tx hash hex. Populated by
+# finalize_deployment running in a background greenlet. Finished entries are
+# dropped after DEPLOYMENT_STATUS_TTL seconds; the status route then falls
+# back to looking up the receipt on chain.
+DEPLOYMENT_STATUS_TTL = 3600
+_deployments = {}
+_deployment_finished_at = {}
+
 
+def record_deployment(tx_hash, deployment):
+    """Stores the status of a deployment and evicts finished entries past their TTL."""
+    key = tx_hash.lower()
+    _deployments[key] = deployment
+    now = time.monotonic()
+    if deployment["status"] != "pending":
+        _deployment_finished_at[key] = now
 
-        Contract = w3.eth.contract(abi=abi, bytecode=bytecode)
-        nonce = w3.eth.get_transaction_count(account.address)
+    expired = [
+        expired_key for expired_key, finished_at in _deployment_finished_at.items()
+        if now - finished_at > DEPLOYMENT_STATUS_TTL
+    ]
+    for expired_key in expired:
+        del _deployment_finished_at[expired_key]
+        _deployments.pop(expired_key, None)
+
+
+def deployment_from_receipt(tx_receipt):
+    """Builds the status entry for a mined deployment transaction."""
+    if tx_receipt.status == 1:
+        return {"status": "deployed", "contractAddress": tx_receipt.contractAddress}
+    return {"status": "failed", "error": "Transaction failed during deployment. Check testnet explorer."}
+
+
+def lookup_deployment(tx_hash):
+    """Looks up a deployment's status on chain, for hashes not tracked in _deployments.
+
+    Returns None if the node doesn't know the transaction, or if it isn't a
+    contract creation sent from this backend's deployer account.
+    """
+    if ACCOUNT is None:
+        return None
+    tx_receipt = _receipt_or_none(tx_hash)
+    if tx_receipt is not None:
+        if not tx_receipt.get('contractAddress') or not _is_deployer(tx_receipt.get('from')):
+            return None
+        return deployment_from_receipt(tx_receipt)
+    try:
+        tx = w3.eth.get_transaction(tx_hash)
+    except TransactionNotFound:
+        return None
+    if tx.get('to') is not None or not _is_deployer(tx.get('from')):
+        return None
+    return {"status": "pending"}
+
+
+def _is_deployer(address):
+    """Tells whether `address` is this backend's deployer account."""
+    return bool(address) and address.lower() == ACCOUNT.address.lower()
+
+
+# --- Deployment Functions ---
+def submit_deployment(w3_instance, constructor_args):
+    """Builds, signs and sends the deployment transaction without waiting for it to be mined."""
+    if not ACCOUNT:
+        return {"error": "Private key not configured in environment variables or invalid."}
+    if _ARTIFACT_ERROR:
+        return {"error": _ARTIFACT_ERROR}
+    # Connectivity isn't probed here; the first RPC below surfaces connection errors
+    if not w3_instance:
+        return {"error": f"Backend not connected to network. RPC_URL: {RPC_URL}"}
+
+
+    try:
+        w3 = w3_instance
+
+        deploy_data = encoded_constructor_data(*constructor_args)
 
-        print("Backend estimating gas...")
         try:
-            gas_estimate = Contract.constructor(*constructor_args).estimate_gas({
-                'from': account.address,
-                'nonce': nonce
-            })
-            print(f"Backend gas estimate: {gas_estimate}")
+            chain_id = _chain_id()
         except Exception as e:
-            print(f"Backend gas estimation error: {e}")
-            # Attempt to get estimated gas price to provide more context if gas estimation fails
+            print(f"Backend error fetching chain id: {e}")
+            return {"error": f"Error fetching chain id: {e}"}
+
+        bucket = gas_estimate_bucket(constructor_args)
+        gas_estimate = GAS_LIMIT_OVERRIDE or _cached_gas_estimates.get(bucket)
+        gas_price = None
+        gas_price_error = None
+
+        if gas_estimate:
+            print(f"Backend using cached gas estimate: {gas_estimate}")
+        else:
+            # The gas estimate and gas price are fetched in one batched round trip
+            print("Backend estimating gas...")
+            (gas_estimate, gas_error), (gas_price, gas_price_error) = batch_rpc_calls([
+                ('eth_estimateGas', [{'from': ACCOUNT.address, 'data': deploy_data}]),
+                ('eth_gasPrice', []),
+            ])
+            if not gas_price_error:
+                gas_price = int(gas_price, 16)
+                remember_gas_price(gas_price)
+
+            if gas_error:
+                print(f"Backend gas estimation error: {gas_error}")
+                # Report the gas price from the same batch to provide more context
+                if gas_price_error:
+                    print(f"Could not retrieve current gas price in gas estimation error handler: {gas_price_error}")
+                else:
+                    print(f"Current estimated gas price: {w3.from_wei(gas_price, 'gwei')} gwei")
+                return {"error": f"Error estimating gas: {gas_error}. Check testnet ETH balance and constructor args."}
+            gas_estimate = int(gas_estimate, 16)
+            _cached_gas_estimates[bucket] = gas_estimate
+            print(f"Backend gas estimate: {gas_estimate}")
+
+        if gas_price is None and not gas_price_error:
             try:
-                estimated_gas_price = w3.eth.gas_price
-                print(f"Current estimated gas price: {w3.from_wei(estimated_gas_price, 'gwei')} gwei")
-            except Exception as gas_price_e:
-                print(f"Could not retrieve current gas price in gas estimation error handler: {gas_price_e}")
-            return {"error": f"Error estimating gas: {e}. Check testnet ETH balance and constructor args."}
+                gas_price = cached_gas_price(w3)
+            except Exception as e:
+                gas_price_error = e
 
-        try:
-            current_gas_price = w3.eth.gas_price
-            gas_price_to_use = current_gas_price
-        except Exception as e:
-            print(f"Backend error fetching gas price, using fallback: {e}")
+        if gas_price_error:
+            print(f"Backend error fetching gas price, using fallback: {gas_price_error}")
             gas_price_to_use = w3.to_wei('1', 'gwei') # Fallback fixed gas price
+        else:
+            gas_price_to_use = gas_price
 
 
-        transaction = Contract.constructor(*constructor_args).build_transaction({
-            'from': account.address,
-            'nonce': nonce,
-            'gas': gas_estimate + 100000, # Add a buffer
-            'gasPrice': gas_price_to_use,
-            'chainId': w3.eth.chain_id,
-        })
-        print("Backend transaction built.")
+        nonce = reserve_nonce(w3, ACCOUNT.address)
+        signed_transaction = None
+        try:
+            # Contract creation: no 'to' field, calldata is bytecode + encoded args
+            transaction = {
+                'from': ACCOUNT.address,
+                'data': deploy_data,
+                'nonce': nonce,
+                'gas': gas_estimate + 100000, # Add a buffer
+                'gasPrice': gas_price_to_use,
+                'chainId': chain_id,
+            }
+            print("Backend transaction built.")
+
+            signed_transaction = ACCOUNT.sign_transaction(transaction)
+            print("Backend transaction signed.")
+
+            print(f"Backend sending transaction with nonce {nonce}...")
+            tx_hash = w3.eth.send_raw_transaction(signed_transaction.rawTransaction)
+        except Exception as e:
+            if not handle_send_failure(w3, ACCOUNT.address, nonce, e, signed_transaction):
+                raise
+            print(f"Backend transaction reached the node despite the send error: {e}")
+            tx_hash = signed_transaction.hash
+        print(f"Backend transaction sent. Hash: {w3.to_hex(tx_hash)}")
+        return {"txHash": w3.to_hex(tx_hash)}
 
-        signed_transaction = w3.eth.account.sign_transaction(transaction, private_key)
-        print("Backend transaction signed.")
+    except Exception as e:
+        print(f"An unexpected backend error occurred during deployment: {e}")
+        return {"error": f"An unexpected error occurred: {e}"}
 
-        print("Backend sending transaction...")
-        tx_hash = w3.eth.send_raw_transaction(signed_transaction.rawTransaction)
-        print(f"Backend transaction sent. Hash: {w3.to_hex(tx_hash)}")
 
-        print("Backend waiting for transaction to be mined...")
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=300)
+def _receipt_or_none(tx_hash):
+    """Returns the transaction receipt, or None if the transaction isn't mined yet."""
+    try:
+        return w3.eth.get_transaction_receipt(tx_hash)
+    except TransactionNotFound:
+        return None
+
+
+def poll_receipt(tx_hash, deadline):
+    """Polls for a receipt over HTTP with exponential backoff (0.5s doubling up to 4s).
+
+    `deadline` is a time.monotonic() value. Sleeping with gevent.sleep yields to
+    other greenlets between polls. Raises TimeExhausted once the deadline passes.
+    """
+    delay = 0.5
+    while True:
+        tx_receipt = _receipt_or_none(tx_hash)
+        if tx_receipt is not None:
+            return tx_receipt
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeExhausted(f"Transaction {tx_hash} is not in the chain by the deadline")
+        gevent.sleep(min(delay, remaining))
+        delay = min(delay * 2, 4.0)
+
+
+# --- Shared newHeads Subscription ---
+# One WebSocket subscription per process serves every pending deployment.
+# On each new head, the listener checks all waiting receipts in one batched
+# request and wakes the waiters whose transaction was mined. It stops once
+# nobody is waiting and is restarted by the next waiter.
+HEAD_IDLE_TIMEOUT = 60 # Seconds without a new head before the subscription is considered dead
+# Lowercase tx hash -> {"event": Event, "receipt": receipt once mined, "error": listener failure or None}
+_receipt_waiters = {}
+_head_listener = None
+
+
+def _wake_mined_waiters():
+    """Hands each waiter its receipt once mined, from one batched lookup per head."""
+    tx_hashes = list(_receipt_waiters)
+    if not tx_hashes:
+        return
+    try:
+        results = batch_rpc_calls([('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes])
+    except Exception as e:
+        print(f"Backend error checking receipts on new head: {e}")
+        return
+    for tx_hash, (tx_receipt, _) in zip(tx_hashes, results):
+        waiter = _receipt_waiters.get(tx_hash)
+        if tx_receipt and waiter:
+            # Formatted the same way w3.eth.get_transaction_receipt would return it
+            waiter["receipt"] = AttributeDict.recursive(receipt_formatter(tx_receipt))
+            waiter["event"].set()
+
+
+def _listen_for_heads():
+    """Runs the shared newHeads subscription while there are receipt waiters."""
+    global _head_listener
+    ws = None
+    try:
+        ws = websocket.create_connection(WS_RPC_URL, timeout=30)
+        ws.send(orjson.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}).decode())
+        reply = orjson.loads(ws.recv())
+        if reply.get('error'):
+            raise websocket.WebSocketException(f"newHeads subscription failed: {reply['error']}")
+
+        ws.settimeout(HEAD_IDLE_TIMEOUT)
+        while _receipt_waiters:
+            ws.recv() # Blocks until the next block head arrives
+            _wake_mined_waiters()
+        # No yield between the check above and this reset, so a new waiter can't be missed
+        _head_listener = None
+    except Exception as e:
+        _head_listener = None
+        print(f"Backend newHeads subscription failed: {e}")
+        # Wake everyone so they can fall back to HTTP polling
+        for waiter in list(_receipt_waiters.values()):
+            waiter["error"] = e
+            waiter["event"].set()
+    finally:
+        if ws is not None:
+            ws.close()
+
+
+def wait_for_receipt_via_ws(tx_hash, timeout):
+    """Waits for a receipt using the shared newHeads subscription on WS_RPC_URL.
+
+    Raises TimeExhausted if it isn't mined within `timeout`, or
+    websocket.WebSocketException if the subscription fails.
+    """
+    global _head_listener
+    deadline = time.monotonic() + timeout
+    key = tx_hash.lower()
+    waiter = {"event": gevent.event.Event(), "receipt": None, "error": None}
+    _receipt_waiters[key] = waiter
+    if _head_listener is None:
+        _head_listener = gevent.spawn(_listen_for_heads)
+    try:
+        # No up-front receipt check: if it was mined before the subscription
+        # started, the listener's lookup on the next head finds it
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not waiter["event"].wait(remaining):
+            raise TimeExhausted(f"Transaction {tx_hash} is not in the chain after {timeout} seconds")
+        if waiter["receipt"] is None:
+            raise websocket.WebSocketException(f"newHeads subscription failed: {waiter['error']}")
+        return waiter["receipt"]
+    finally:
+        _receipt_waiters.pop(key, None)
+
+
+def finalize_deployment(tx_hash):
+    """Waits for a submitted deployment to be mined and records the outcome in _deployments."""
+    try:
+        print(f"Backend waiting for transaction {tx_hash} to be mined...")
+        tx_receipt = None
+        deadline = time.monotonic() + 300
+        if WS_RPC_URL:
+            try:
+                tx_receipt = wait_for_receipt_via_ws(tx_hash, timeout=300)
+            except (websocket.WebSocketException, OSError) as ws_error:
+                print(f"Backend WebSocket receipt wait failed, falling back to HTTP polling: {ws_error}")
+        if tx_receipt is None:
+            tx_receipt = poll_receipt(tx_hash, deadline)
 
         if tx_receipt.status == 1:
-            contract_address = tx_receipt.contractAddress
-            print(f"Backend contract deployed at address: {contract_address}")
-            return {"contractAddress": contract_address}
+            print(f"Backend contract deployed at address: {tx_receipt.contractAddress}")
         else:
             print("Backend transaction failed!")
             print("Backend Receipt:", tx_receipt)
@@ -132,11 +763,11 @@ def deploy_contract_backend(w3_instance, artifact_path, private_key, constructor
             except Exception as tx_error:
                  print(f"Could not retrieve transaction details for troubleshooting: {tx_error}")
 
-            return {"error": "Transaction failed during deployment. Check testnet explorer."}
+        record_deployment(tx_hash, deployment_from_receipt(tx_receipt))
 
     except Exception as e:
-        print(f"An unexpected backend error occurred during deployment: {e}")
-        return {"error": f"An unexpected error occurred: {e}"}
+        print(f"An unexpected backend error occurred while waiting for deployment {tx_hash}: {e}")
+        record_deployment(tx_hash, {"status": "failed", "error": f"An unexpected error occurred: {e}"})
 
 
 # --- Flask Route for Deployment ---
@@ -144,64 +775,100 @@ def deploy_contract_backend(w3_instance, artifact_path, private_key, constructor
 def deploy_token():
     """Receives token details and triggers contract deployment."""
     print("Received request to /deploy-token")
-    data = request.get_json()
+    try:
+        data = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        data = None
 
-    if not data:
+    if not data or not isinstance(data, dict):
         print("No JSON data received.")
-        return jsonify({"error": "Invalid JSON"}), 400
+        return json_response({"error": "Invalid JSON"}, 400)
 
     token_name = data.get('name')
     token_symbol = data.get('symbol')
 
     if not token_name or not token_symbol:
         print("Missing token name or symbol in request.")
-        return jsonify({"error": "Missing token name or symbol"}), 400
+        return json_response({"error": "Missing token name or symbol"}, 400)
 
-    if not FEE_RECIPIENT_ADDRESS:
-         print("Error: FEE_RECIPIENT_ADDRESS environment variable not set.")
-         return jsonify({"error": "Backend configuration error: Fee recipient address not set."}), 500
+    if not isinstance(token_name, str) or not isinstance(token_symbol, str):
+        print("Token name or symbol in request is not a string.")
+        return json_response({"error": "Token name and symbol must be strings"}, 400)
 
-    print(f"Deploying token: {token_name} ({token_symbol})")
+    if len(token_name) > MAX_TOKEN_NAME_LENGTH or len(token_symbol) > MAX_TOKEN_SYMBOL_LENGTH:
+        print("Token name or symbol in request is too long.")
+        return json_response({"error": f"Token name must be at most {MAX_TOKEN_NAME_LENGTH} characters and symbol at most {MAX_TOKEN_SYMBOL_LENGTH}"}, 400)
 
-    # --- Hardcoded Parameters for Pump.fun model ---
-    # LP Migration Market Cap (example: 0.01 ETH equivalent)
-    # Using w3.to_wei here as w3 is initialized outside the function
-    if w3 and w3.is_connected():
-        lp_migration_market_cap_wei = w3.to_wei(0.01, 'ether')
-    else:
-         # Fallback value if w3 is not connected, though deployment will likely fail anyway
-         print("Warning: w3 not connected in backend route, using fallback LP market cap.")
-         lp_migration_market_cap_wei = 10**16 # Defaulting to 0.01 ether in wei
+    if not FEE_RECIPIENT_ADDRESS:
+         print("Error: FEE_RECIPIENT_ADDRESS environment variable not set or invalid.")
+         return json_response({"error": "Backend configuration error: Fee recipient address not set or invalid."}, 500)
 
+    print(f"Deploying token: {token_name} ({token_symbol})")
 
     constructor_arguments = [
         token_name,
         token_symbol,
-        lp_migration_market_cap_wei,
+        LP_MIGRATION_MARKET_CAP_WEI,
         FEE_RECIPIENT_ADDRESS # Use the address from environment variable
     ]
 
-    # Call the deployment function
-    deployment_result = deploy_contract_backend(
+    # Send the deployment transaction; mining is awaited in the background
+    deployment_result = submit_deployment(
         w3, # Pass the web3 instance
-        CONTRACT_ARTIFACT_PATH,
-        PRIVATE_KEY,
         constructor_arguments
     )
 
-    if "contractAddress" in deployment_result:
-        return jsonify({"tokenAddress": deployment_result["contractAddress"]}), 200
-    else:
+    if "txHash" not in deployment_result:
         # Return a more specific error if available
-        return jsonify({"error": deployment_result.get("error", "Deployment failed")}), 500
+        return json_response({"error": deployment_result.get("error", "Deployment failed")}, 500)
+
+    tx_hash = deployment_result["txHash"]
+    record_deployment(tx_hash, {"status": "pending"})
+    gevent.spawn(finalize_deployment, tx_hash)
+
+    return json_response({
+        "txHash": tx_hash,
+        "statusUrl": url_for('deploy_status', tx_hash=tx_hash),
+    }, 202)
+
+
+# --- Flask Route for Deployment Status ---
+@app.route('/deploy-status/<tx_hash>', methods=['GET'])
+def deploy_status(tx_hash):
+    """Reports whether a submitted deployment is pending, deployed or failed."""
+    deployment = _deployments.get(tx_hash.lower())
+    if deployment is None:
+        # Not tracked here (e.g. submitted before a restart, or evicted), so ask the node
+        try:
+            if len(HexBytes(tx_hash)) != 32:
+                return json_response({"error": "Invalid transaction hash"}, 400)
+        except ValueError:
+            return json_response({"error": "Invalid transaction hash"}, 400)
+        if not w3:
+            return json_response({"error": f"Backend not connected to network. RPC_URL: {RPC_URL}"}, 500)
+        try:
+            deployment = lookup_deployment(tx_hash)
+        except Exception as e:
+            print(f"Backend error looking up deployment {tx_hash}: {e}")
+            return json_response({"error": f"Error looking up transaction: {e}"}, 500)
+    if deployment is None:
+        return json_response({"error": "Unknown transaction hash"}, 404)
+    return json_response(deployment, 200)
 
 
 # --- Running the Flask App ---
 # This is for local testing purposes only (like in Colab directly).
-# Render will use the Procfile and Waitress.
+# Render will use the Procfile and Gunicorn with gevent workers.
 if __name__ == '__main__':
     print("Starting Flask backend server locally (for testing)...")
     # This part will not run on Render because Render uses the Procfile
     # You can keep this for local debugging if needed.
     # Make sure to set environment variables manually for local testing.
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Both servers handle requests concurrently, so a deployment waiting on
+    # the network no longer blocks other incoming requests.
+    if os.environ.get('WSGI_SERVER', 'gevent') == 'waitress':
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=5000, threads=8, connection_limit=200)
+    else:
+        from gevent.pywsgi import WSGIServer
+        WSGIServer(('0.0.0.0', 5000), app).serve_forever()